@@ -3,31 +3,51 @@ Main Bot Class for Telegram Tag Bot
 Handles bot initialization, command registration, and application lifecycle
 """
 
+import asyncio
 import logging
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
-from database import BotDatabase
-# Attendance system removed for simplicity
-from handlers import BotHandlers
-from config import DATABASE_PATH
+import signal
+from config import DATABASE_PATH, WEBHOOK_URL, PORT, POLLING_TIMEOUT
 import os
 
 logger = logging.getLogger(__name__)
 
+def use_uvloop():
+    """
+    Use the faster libuv-based event loop when uvloop is installed
+    Call before any event loop is created
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
 class TelegramTagBot:
     """Main bot class that orchestrates all components"""
     
     def __init__(self, token: str):
         self.token = token
-        self.database = BotDatabase(DATABASE_PATH)
+        self.db_path = DATABASE_PATH
         
-        # Initialize handlers
-        self.handlers = BotHandlers(self.database)
+        # Database, handlers and application are created in run() so that
+        # importing this module stays cheap
+        self.database = None
+        self.handlers = None
         self.application = None
         
     def _register_handlers(self):
         """Register all command and message handlers"""
+        from telegram.ext import ChatMemberHandler, CommandHandler, MessageHandler, filters
+        
         app = self.application
         
+        # Record group membership from every group message before anything
+        # else handles it; /tag reads members from this index
+        app.add_handler(MessageHandler(
+            filters.ChatType.GROUPS & ~filters.StatusUpdate.LEFT_CHAT_MEMBER,
+            self.handlers.track_member_handler
+        ), group=-1)
+        
         # Command handlers
         app.add_handler(CommandHandler("start", self.handlers.start_handler))
         app.add_handler(CommandHandler("help", self.handlers.help_handler))
@@ -41,6 +61,24 @@ class TelegramTagBot:
         
         # Attendance commands removed for simplicity
         
+        # Track members joining and leaving groups
+        app.add_handler(MessageHandler(
+            filters.StatusUpdate.NEW_CHAT_MEMBERS,
+            self.handlers.new_members_handler
+        ))
+        app.add_handler(MessageHandler(
+            filters.StatusUpdate.LEFT_CHAT_MEMBER,
+            self.handlers.left_member_handler
+        ))
+        app.add_handler(ChatMemberHandler(
+            self.handlers.chat_member_handler,
+            ChatMemberHandler.CHAT_MEMBER
+        ))
+        app.add_handler(ChatMemberHandler(
+            self.handlers.my_chat_member_handler,
+            ChatMemberHandler.MY_CHAT_MEMBER
+        ))
+        
         # Message handler for AFK detection and mentions
         app.add_handler(MessageHandler(
             filters.TEXT & ~filters.COMMAND, 
@@ -49,24 +87,94 @@ class TelegramTagBot:
         
         logger.info("All handlers registered successfully")
     
-    def run(self):
-        """Start the bot"""
+    def build_application(self):
+        """Create the database, handlers and Telegram application"""
+        from telegram.ext import Application
+        from database import BotDatabase
+        from handlers import BotHandlers, ChatOrderedUpdateProcessor
+        
+        # Initialize database and handlers
+        self.database = BotDatabase.get(self.db_path)
+        self.handlers = BotHandlers(self.database)
+        
+        # Create application; updates are handled concurrently since
+        # handlers mostly wait on the Telegram API, but in order within a chat
+        self.application = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(ChatOrderedUpdateProcessor(256))
+            .post_shutdown(self._flush_database)
+            .build()
+        )
+        
+        # Register handlers
+        self._register_handlers()
+        return self.application
+    
+    def run(self, application=None):
+        """
+        Start the bot on the current event loop
+        Pass an application from build_application() to reuse it across restarts
+        """
         try:
-            # Create application
-            self.application = Application.builder().token(self.token).build()
-            
-            # Register handlers
-            self._register_handlers()
+            self.application = application or self.build_application()
             
             logger.info("Bot started successfully")
             
-            # Start polling
-            self.application.run_polling(allowed_updates=['message', 'edited_message'])
+            # The event loop is left open so a restart can run on it again
+            allowed_updates = ['message', 'edited_message', 'chat_member', 'my_chat_member']
+            if WEBHOOK_URL:
+                # Telegram pushes updates to us; no idle long-poll requests
+                loop = asyncio.get_event_loop()
+                loop.run_until_complete(self._run_webhook(allowed_updates))
+            else:
+                # Start polling
+                self.application.run_polling(
+                    allowed_updates=allowed_updates,
+                    timeout=POLLING_TIMEOUT,
+                    poll_interval=0.0,
+                    close_loop=False
+                )
             
         except Exception as e:
             logger.error(f"Error starting bot: {e}")
             raise
     
+    async def _run_webhook(self, allowed_updates):
+        """Serve Telegram updates and the health check from one web server"""
+        from webhook import create_web_app
+        
+        app = self.application
+        web_app = create_web_app(app, self.token)
+        
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        
+        async with app:
+            await app.bot.set_webhook(
+                url=f"{WEBHOOK_URL.rstrip('/')}/{self.token}",
+                allowed_updates=allowed_updates
+            )
+            await app.start()
+            server = web_app.listen(PORT, address='0.0.0.0')
+            logger.info(f"Webhook server listening on port {PORT}")
+            
+            try:
+                await stop_event.wait()
+            finally:
+                server.stop()
+                await app.stop()
+        
+        # post_shutdown is only run by run_polling/run_webhook
+        await self._flush_database(app)
+    
+    async def _flush_database(self, application):
+        """Write pending database changes before exiting"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.database.flush)
+    
     async def _set_bot_commands(self):
         """Set bot commands for Telegram UI"""
         from telegram import BotCommand
@@ -7,13 +7,21 @@ import os
 # Bot Configuration
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
 
+# Webhook Configuration (polling is used when no public URL is set)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL') or os.getenv('RENDER_EXTERNAL_URL', '')
+PORT = int(os.getenv('PORT', '8443'))
+POLLING_TIMEOUT = 50  # seconds each long poll may wait for updates
+
 # Database Configuration
 DATABASE_PATH = 'bot_data.json'
 
 # Default Settings
 DEFAULT_TAG_EMOJI = '🔔'
 TAG_BATCH_SIZE = 10
-MAX_BROADCAST_DELAY = 0.5  # seconds between broadcasts to avoid rate limiting
+BROADCAST_RATE_LIMIT = 30  # messages per second (Telegram's global bot limit)
+GROUP_RATE_LIMIT = 20  # messages per minute to a single group
+MEMBER_CACHE_TTL = 60  # seconds a group's member list is reused by /tag
+ADMIN_CACHE_TTL = 300  # seconds a group's administrator list is reused
 
 # Command Configuration
 COMMANDS = {
@@ -27,6 +35,3 @@ COMMANDS = {
     'removeadmin': 'Remove admin (Owner only)',
     'help': 'Show available commands'
 }
-
-# Rate Limiting
-RATE_LIMIT_DELAY = 0.1  # seconds between API calls
@@ -3,25 +3,107 @@ Database management for the Telegram Tag Bot
 Handles persistent storage of user data, AFK statuses, and bot settings
 """
 
+import atexit
 import json
 import os
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+import time
 from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Any
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# Loaded databases keyed by path, shared by every BotDatabase.get() caller
+_DB_CACHE: Dict[str, 'BotDatabase'] = {}
+
 class BotDatabase:
     """Manages bot data persistence using JSON files"""
     
-    def __init__(self, db_path: str = 'bot_data.json'):
+    __slots__ = (
+        'db_path', 'data', 'flush_delay',
+        '_dirty', '_last_flush', '_flush_lock', '_flush_timer', '_lock',
+        '_owner_id', '_admin_set', '_default_emoji', '_afk_set',
+        '_users_cache', '_groups_cache', 'username_index', 'last_full_refresh'
+    )
+    
+    def __init__(self, db_path: str = 'bot_data.json', flush_delay: float = 5.0):
         self.db_path = db_path
         self.data = self._load_data()
+        
+        # Hot permission/settings lookups, kept in sync by the mutators
+        self._owner_id: Optional[int] = self.data['owner_id']
+        self._admin_set = self.data['admins']
+        self._default_emoji: str = self.data['settings'].get('default_emoji', '🔔')
+        self._afk_set = set(self.data['afk_users'])
+        
+        # Lowercased username -> user ID, for resolving @mentions
+        self.username_index: Dict[str, int] = {
+            user['username'].lower(): user_id
+            for user_id, user in self.data['users'].items() if user.get('username')
+        }
+        
+        # Group ID -> when its member list was last checked against Telegram
+        # (monotonic; not persisted, so every group is re-checked after a restart)
+        self.last_full_refresh: Dict[int, float] = {}
+        
+        # Memoized ID lists, invalidated when a new user/group is added
+        self._users_cache: Optional[List[int]] = None
+        self._groups_cache: Optional[List[int]] = None
+        
+        # Mutations only mark the data dirty; a timer flushes them to disk
+        self.flush_delay = flush_delay
+        self._dirty = False
+        self._last_flush = time.time()
+        self._flush_lock = threading.Lock()
+        self._flush_timer = None
+        
+        # Guards self.data; handlers and the flush timer run on different threads
+        self._lock = threading.RLock()
+        atexit.register(self._flush_if_dirty, True)
+    
+    @classmethod
+    def get(cls, db_path: str = 'bot_data.json') -> 'BotDatabase':
+        """Return the shared database for a path, loading it on first use"""
+        database = _DB_CACHE.get(db_path)
+        if database is None:
+            database = _DB_CACHE[db_path] = cls(db_path)
+        return database
     
     def _load_data(self) -> Dict[str, Any]:
         """Load data from JSON file"""
+        data = self._read_file()
+        
+        # JSON object keys are always strings; use int IDs at runtime
+        for table in ('users', 'profiles', 'groups', 'afk_users'):
+            data[table] = {int(key): value for key, value in data.get(table, {}).items()}
+        
+        # Membership collections are sets at runtime and lists on disk
+        data['admins'] = set(data.get('admins', []))
+        for group in data.get('groups', {}).values():
+            group['members'] = set(group.get('members', []))
+        
+        # Older versions stored AFK timestamps as ISO strings
+        for status in data['afk_users'].values():
+            if isinstance(status.get('timestamp'), str):
+                try:
+                    status['timestamp'] = int(datetime.fromisoformat(status['timestamp']).timestamp())
+                except ValueError:
+                    status['timestamp'] = int(time.time())
+        return data
+    
+    def _read_file(self) -> Dict[str, Any]:
+        """Read the raw JSON structure from disk"""
         try:
             if os.path.exists(self.db_path):
+                if orjson is not None:
+                    with open(self.db_path, 'rb') as f:
+                        return orjson.loads(f.read())
                 with open(self.db_path, 'r', encoding='utf-8') as f:
                     return json.load(f)
         except Exception as e:
@@ -32,6 +114,7 @@ class BotDatabase:
             'owner_id': None,
             'admins': [],
             'users': {},
+            'profiles': {},
             'groups': {},
             'afk_users': {},
             'settings': {
@@ -39,132 +122,279 @@ class BotDatabase:
             }
         }
     
-    def _save_data(self) -> bool:
-        """Save data to JSON file"""
+    def _save_data(self, fsync: bool = False) -> bool:
+        """Save data to JSON file (atomically, via a temp file)"""
+        tmp_path = self.db_path + '.tmp'
         try:
-            with open(self.db_path, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, indent=2, ensure_ascii=False)
+            with self._lock:
+                if orjson is not None:
+                    payload = orjson.dumps(self.data, default=list, option=orjson.OPT_NON_STR_KEYS)
+                else:
+                    payload = json.dumps(self.data, default=list, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self.db_path)
             return True
         except Exception as e:
             logger.error(f"Error saving database: {e}")
             return False
     
+    def _mark_dirty(self) -> bool:
+        """Mark data as changed and schedule a debounced flush"""
+        with self._lock:
+            self._dirty = True
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_delay, self._flush_if_dirty)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        return True
+    
+    def _flush_if_dirty(self, fsync: bool = False) -> bool:
+        """Write pending changes to disk, if any"""
+        with self._flush_lock:
+            with self._lock:
+                self._flush_timer = None
+                if not self._dirty:
+                    return True
+                self._dirty = False
+            if not self._save_data(fsync):
+                self._mark_dirty()
+                return False
+            self._last_flush = time.time()
+            return True
+    
+    def flush(self) -> bool:
+        """Write pending changes to disk now (and fsync them)"""
+        return self._flush_if_dirty(True)
+    
     def set_owner(self, user_id: int) -> bool:
         """Set the bot owner (first user to interact)"""
-        if self.data['owner_id'] is None:
-            self.data['owner_id'] = user_id
-            return self._save_data()
-        return False
+        with self._lock:
+            if self._owner_id is None:
+                self.data['owner_id'] = self._owner_id = user_id
+                return self._mark_dirty()
+            return False
     
     def get_owner(self) -> Optional[int]:
         """Get the bot owner ID"""
-        return self.data['owner_id']
+        return self._owner_id
     
     def is_owner(self, user_id: int) -> bool:
         """Check if user is the owner"""
-        return self.data['owner_id'] == user_id
+        return user_id == self._owner_id
     
     def add_admin(self, user_id: int) -> bool:
         """Add a user as admin"""
-        if user_id not in self.data['admins']:
-            self.data['admins'].append(user_id)
-            return self._save_data()
-        return False
+        with self._lock:
+            if user_id not in self._admin_set:
+                self._admin_set.add(user_id)
+                return self._mark_dirty()
+            return False
     
     def remove_admin(self, user_id: int) -> bool:
         """Remove a user from admins"""
-        if user_id in self.data['admins']:
-            self.data['admins'].remove(user_id)
-            return self._save_data()
-        return False
+        with self._lock:
+            if user_id in self._admin_set:
+                self._admin_set.remove(user_id)
+                return self._mark_dirty()
+            return False
     
     def is_admin(self, user_id: int) -> bool:
         """Check if user is an admin"""
-        return user_id in self.data['admins']
+        return user_id in self._admin_set
     
     def is_owner_or_admin(self, user_id: int) -> bool:
         """Check if user is owner or admin"""
-        return self.is_owner(user_id) or self.is_admin(user_id)
+        return user_id == self._owner_id or user_id in self._admin_set
     
     def add_user(self, user_id: int, username: str = None, first_name: str = None):
         """Add or update user information"""
-        self.data['users'][str(user_id)] = {
-            'username': username,
-            'first_name': first_name,
-            'last_seen': datetime.now().isoformat()
-        }
-        self._save_data()
+        with self._lock:
+            existing = self.data['users'].get(user_id)
+            if existing is None:
+                self._users_cache = None
+            elif existing['username'] == username and existing['first_name'] == first_name:
+                # Nothing worth a write; last_seen goes out with the next flush
+                existing['last_seen'] = int(time.time())
+                return
+            
+            if existing is not None and existing['username'] and existing['username'] != username:
+                self.username_index.pop(existing['username'].lower(), None)
+            if username:
+                self.username_index[username.lower()] = user_id
+            self.data['users'][user_id] = {
+                'username': username,
+                'first_name': first_name,
+                'last_seen': int(time.time())
+            }
+            self.data['profiles'].pop(user_id, None)
+            self._mark_dirty()
+    
+    def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get stored information about a user"""
+        return self.data['users'].get(user_id)
+    
+    def add_profile(self, user_id: int, username: str = None, first_name: str = None):
+        """Remember the name of a group member who hasn't used the bot (not a broadcast recipient)"""
+        with self._lock:
+            if user_id in self.data['users']:
+                return
+            existing = self.data['profiles'].get(user_id)
+            if existing is not None and existing['username'] == username and existing['first_name'] == first_name:
+                return
+            self.data['profiles'][user_id] = {
+                'username': username,
+                'first_name': first_name
+            }
+            self._mark_dirty()
+    
+    def get_member_info(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get a group member's stored name, from users or group-only profiles"""
+        return self.data['users'].get(user_id) or self.data['profiles'].get(user_id)
+    
+    def get_user_id_by_username(self, username: str) -> Optional[int]:
+        """Look up a known user's ID by username (case-insensitive)"""
+        return self.username_index.get(username.lower())
     
     def add_group(self, group_id: int, group_title: str = None):
         """Add or update group information"""
-        self.data['groups'][str(group_id)] = {
-            'title': group_title,
-            'last_active': datetime.now().isoformat(),
-            'members': []  # Store member IDs for enhanced tagging
-        }
-        self._save_data()
+        with self._lock:
+            existing = self.data['groups'].get(group_id)
+            if existing is not None:
+                # Keep the stored members; only a title change needs a write
+                existing['last_active'] = int(time.time())
+                if existing['title'] != group_title:
+                    existing['title'] = group_title
+                    self._mark_dirty()
+                return
+            
+            self._groups_cache = None
+            self.data['groups'][group_id] = {
+                'title': group_title,
+                'last_active': int(time.time()),
+                'members': set()  # Store member IDs for enhanced tagging
+            }
+            self._mark_dirty()
     
     def add_group_member(self, group_id: int, user_id: int):
         """Add a member to group's member list"""
-        group_key = str(group_id)
-        if group_key not in self.data['groups']:
-            self.add_group(group_id)
-        
-        if 'members' not in self.data['groups'][group_key]:
-            self.data['groups'][group_key]['members'] = []
-        
-        if user_id not in self.data['groups'][group_key]['members']:
-            self.data['groups'][group_key]['members'].append(user_id)
-            self._save_data()
+        with self._lock:
+            if group_id not in self.data['groups']:
+                self.add_group(group_id)
+            
+            members = self.data['groups'][group_id].setdefault('members', set())
+            if user_id not in members:
+                members.add(user_id)
+                self._mark_dirty()
+    
+    def add_group_members(self, group_id: int, user_ids: Iterable[int]):
+        """Add several members to a group's member list at once"""
+        with self._lock:
+            if group_id not in self.data['groups']:
+                self.add_group(group_id)
+            
+            members = self.data['groups'][group_id].setdefault('members', set())
+            size = len(members)
+            members.update(user_ids)
+            if len(members) != size:
+                self._mark_dirty()
+    
+    def remove_group_member(self, group_id: int, user_id: int):
+        """Remove a member from group's member list"""
+        with self._lock:
+            group = self.data['groups'].get(group_id)
+            if group and user_id in group.get('members', ()):
+                group['members'].discard(user_id)
+                self._mark_dirty()
     
     def get_group_members(self, group_id: int) -> List[int]:
         """Get stored member IDs for a group"""
-        group_key = str(group_id)
-        if group_key in self.data['groups'] and 'members' in self.data['groups'][group_key]:
-            return self.data['groups'][group_key]['members']
+        if group_id in self.data['groups'] and 'members' in self.data['groups'][group_id]:
+            return list(self.data['groups'][group_id]['members'])
         return []
     
+    def mark_group_members_refreshed(self, group_id: int):
+        """Record that a group's member list was just checked against Telegram"""
+        self.last_full_refresh[group_id] = time.monotonic()
+    
+    def group_members_fresh(self, group_id: int, ttl: float = 3600) -> bool:
+        """Check if a group's member list was checked within the last ttl seconds"""
+        refreshed_at = self.last_full_refresh.get(group_id)
+        return refreshed_at is not None and time.monotonic() - refreshed_at < ttl
+    
     def get_all_users(self) -> List[int]:
         """Get all user IDs"""
-        return [int(user_id) for user_id in self.data['users'].keys()]
+        if self._users_cache is None:
+            self._users_cache = list(self.data['users'])
+        return self._users_cache
     
     def get_all_groups(self) -> List[int]:
         """Get all group IDs"""
-        return [int(group_id) for group_id in self.data['groups'].keys()]
+        if self._groups_cache is None:
+            self._groups_cache = list(self.data['groups'])
+        return self._groups_cache
+    
+    def count_users(self) -> int:
+        """Get the number of known users"""
+        return len(self.data['users'])
+    
+    def count_groups(self) -> int:
+        """Get the number of known groups"""
+        return len(self.data['groups'])
+    
+    def iter_users(self) -> Iterator[int]:
+        """Iterate over user IDs (a snapshot, safe across awaits)"""
+        return iter(self.get_all_users())
+    
+    def iter_groups(self) -> Iterator[int]:
+        """Iterate over group IDs (a snapshot, safe across awaits)"""
+        return iter(self.get_all_groups())
     
     def set_afk(self, user_id: int, reason: str = None):
         """Set user as AFK"""
-        self.data['afk_users'][str(user_id)] = {
-            'reason': reason,
-            'timestamp': datetime.now().isoformat()
-        }
-        self._save_data()
+        with self._lock:
+            self.data['afk_users'][user_id] = {
+                'reason': reason,
+                'timestamp': int(time.time())
+            }
+            self._afk_set.add(user_id)
+            self._mark_dirty()
     
     def remove_afk(self, user_id: int) -> bool:
         """Remove user from AFK"""
-        if str(user_id) in self.data['afk_users']:
-            del self.data['afk_users'][str(user_id)]
-            self._save_data()
-            return True
-        return False
+        with self._lock:
+            if user_id in self._afk_set:
+                self._afk_set.discard(user_id)
+                del self.data['afk_users'][user_id]
+                self._mark_dirty()
+                return True
+            return False
     
-    def get_afk_status(self, user_id: int) -> Optional[Dict[str, str]]:
+    def get_afk_status(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user's AFK status"""
-        return self.data['afk_users'].get(str(user_id))
+        return self.data['afk_users'].get(user_id)
     
     def is_afk(self, user_id: int) -> bool:
         """Check if user is AFK"""
-        return str(user_id) in self.data['afk_users']
+        return user_id in self._afk_set
+    
+    def has_afk_users(self) -> bool:
+        """Check if anyone is AFK"""
+        return bool(self._afk_set)
     
     def set_default_emoji(self, emoji: str) -> bool:
         """Set default tagging emoji"""
-        self.data['settings']['default_emoji'] = emoji
-        return self._save_data()
+        with self._lock:
+            self.data['settings']['default_emoji'] = self._default_emoji = emoji
+            return self._mark_dirty()
     
     def get_default_emoji(self) -> str:
         """Get default tagging emoji"""
-        return self.data['settings'].get('default_emoji', '🔔')
+        return self._default_emoji
     
     def get_admins(self) -> List[int]:
         """Get list of admin IDs"""
-        return self.data['admins']
+        return list(self._admin_set)
@@ -4,21 +4,146 @@ Command and message handlers for the Telegram Tag Bot
 
 import asyncio
 import logging
-from typing import List
+import time
+from itertools import chain
+from typing import Awaitable, Dict, List, Tuple, Union
 from telegram import Update, Chat, ChatMember, User
-from telegram.ext import ContextTypes
+from telegram.ext import BaseUpdateProcessor, ContextTypes
 from telegram.error import TelegramError
 from database import BotDatabase
+from config import BROADCAST_RATE_LIMIT, MEMBER_CACHE_TTL, TAG_BATCH_SIZE
 # Attendance system removed
-from utils import get_chat_members, format_user_mention, chunk_list, is_valid_emoji, parse_username, safe_send_message, format_duration, check_bot_admin_status, get_all_chat_members, get_chat_members_extended
+from utils import get_chat_members, format_user_mention, clear_mention_cache, batched, is_valid_emoji, parse_username, safe_send_message, format_duration, check_bot_admin_status, set_bot_admin_status, get_all_chat_members, get_chat_members_extended, LightUser, SEND_LIMITER
 
 logger = logging.getLogger(__name__)
 
+GROUP_CHAT_TYPES = frozenset({Chat.GROUP, Chat.SUPERGROUP})
+
+# Static reply texts, built once at import
+START_OWNER_TEXT = (
+    "You are now the **Owner** of this bot!\n\n"
+    "Available commands:\n"
+    "👑 **Owner Commands:**\n"
+    "/addadmin @username - Add admin\n"
+    "/removeadmin @username - Remove admin\n\n"
+    "🔧 **General Commands:**\n"
+    "/tag - Tag members in group\n"
+    "/afk [reason] - Set AFK status\n"
+    "/back - Remove AFK status\n"
+    "/setemoji <emoji> - Set tag emoji\n"
+    "/broadcast <message> - Send to all users\n"
+    "/help - Show this help"
+)
+
+START_TEXT = (
+    "I'm a group management bot with tagging features!\n\n"
+    "🔧 **Available Commands:**\n"
+    "/tag - Tag members in group\n"
+    "/afk [reason] - Set AFK status\n"
+    "/back - Remove AFK status\n"
+    "/help - Show help\n\n"
+    "Add me to your group to use tagging features!"
+)
+
+HELP_BASE = (
+    "🤖 **Telegram Tag Bot Help**\n\n"
+    "🔧 **General Commands:**\n"
+    "/tag - Tag 10 members at a time\n"
+    "/afk [reason] - Set yourself as AFK\n"
+    "/back - Remove AFK status\n"
+    "/help - Show this help\n\n"
+)
+
+HELP_ADMIN = (
+    "👨‍💻 **Admin Commands:**\n"
+    "/setemoji <emoji> - Set custom tag emoji\n"
+    "/broadcast <message> - Send to all users/groups\n\n"
+)
+
+HELP_OWNER = (
+    "👑 **Owner Commands:**\n"
+    "/addadmin @username - Add admin\n"
+    "/removeadmin @username - Remove admin\n\n"
+)
+
+HELP_TAIL = (
+    "💡 **Tips:**\n"
+    "• Use /tag as reply to tag on specific message\n"
+    "• Bot works in groups and private chats\n"
+    "• AFK auto-replies when someone mentions you\n"
+)
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates concurrently across chats but one at a time, in arrival
+    order, within each chat
+    """
+    
+    __slots__ = ('_chat_locks',)
+    
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # Chat ID -> [lock, number of updates holding or waiting for it]
+        self._chat_locks: Dict[int, list] = {}
+    
+    async def process_update(self, update: object, coroutine: Awaitable):
+        # Overrides the (typing-only) final base method: the base takes a
+        # concurrency slot before do_process_update, so waiting for the chat
+        # there would let one busy chat's queued updates hold every slot.
+        # Take the chat's lock first; only its head update holds a slot
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await super().process_update(update, coroutine)
+            return
+        
+        entry = self._chat_locks.get(chat.id)
+        if entry is None:
+            entry = self._chat_locks[chat.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                # Nobody else is queued for this chat; don't keep its lock around
+                del self._chat_locks[chat.id]
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable):
+        await coroutine
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+
 class BotHandlers:
     """Handles all bot commands and messages"""
     
     def __init__(self, database: BotDatabase):
         self.db = database
+        
+        # Recently fetched /tag member lists: chat ID -> (fetch time, members)
+        self._member_cache: Dict[int, Tuple[float, List[Union[User, LightUser]]]] = {}
+        self._member_cache_size = 1000
+        
+        # Chats with /tag messages still being sent
+        self._tagging = set()
+    
+    async def _get_members(self, chat: Chat, context: ContextTypes.DEFAULT_TYPE) -> List[Union[User, LightUser]]:
+        """Get taggable members, reusing a recent fetch for the same chat"""
+        cached = self._member_cache.get(chat.id)
+        if cached and time.monotonic() - cached[0] < MEMBER_CACHE_TTL:
+            return cached[1]
+        
+        members = await get_chat_members_extended(chat, context.bot, self.db, context.application)
+        self._member_cache.pop(chat.id, None)
+        if len(self._member_cache) >= self._member_cache_size:
+            # Drop the oldest entry
+            self._member_cache.pop(next(iter(self._member_cache)))
+        self._member_cache[chat.id] = (time.monotonic(), members)
+        return members
     
     async def start_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -31,31 +156,12 @@ class BotHandlers:
         # Set as owner if first user
         if self.db.set_owner(user.id):
             await update.message.reply_text(
-                f"🎉 Welcome {user.first_name}!\n\n"
-                "You are now the **Owner** of this bot!\n\n"
-                "Available commands:\n"
-                "👑 **Owner Commands:**\n"
-                "/addadmin @username - Add admin\n"
-                "/removeadmin @username - Remove admin\n\n"
-                "🔧 **General Commands:**\n"
-                "/tag - Tag members in group\n"
-                "/afk [reason] - Set AFK status\n"
-                "/back - Remove AFK status\n"
-                "/setemoji <emoji> - Set tag emoji\n"
-                "/broadcast <message> - Send to all users\n"
-                "/help - Show this help",
+                f"🎉 Welcome {user.first_name}!\n\n{START_OWNER_TEXT}",
                 parse_mode='Markdown'
             )
         else:
             await update.message.reply_text(
-                f"👋 Hello {user.first_name}!\n\n"
-                "I'm a group management bot with tagging features!\n\n"
-                "🔧 **Available Commands:**\n"
-                "/tag - Tag members in group\n"
-                "/afk [reason] - Set AFK status\n"
-                "/back - Remove AFK status\n"
-                "/help - Show help\n\n"
-                "Add me to your group to use tagging features!",
+                f"👋 Hello {user.first_name}!\n\n{START_TEXT}",
                 parse_mode='Markdown'
             )
     
@@ -63,32 +169,14 @@ class BotHandlers:
         """Handle /help command"""
         user = update.effective_user
         
-        help_text = "🤖 **Telegram Tag Bot Help**\n\n"
-        help_text += "🔧 **General Commands:**\n"
-        help_text += "/tag - Tag 10 members at a time\n"
-        help_text += "/afk [reason] - Set yourself as AFK\n"
-        help_text += "/back - Remove AFK status\n"
-        help_text += "/help - Show this help\n\n"
-        
-        # Attendance commands removed for simplicity
-        
+        parts = [HELP_BASE]
         if self.db.is_owner_or_admin(user.id):
-            help_text += "👨‍💻 **Admin Commands:**\n"
-            help_text += "/setemoji <emoji> - Set custom tag emoji\n"
-            help_text += "/broadcast <message> - Send to all users/groups\n\n"
-        
+            parts.append(HELP_ADMIN)
         if self.db.is_owner(user.id):
-            help_text += "👑 **Owner Commands:**\n"
-            help_text += "/addadmin @username - Add admin\n"
-            help_text += "/removeadmin @username - Remove admin\n\n"
+            parts.append(HELP_OWNER)
+        parts.append(HELP_TAIL)
         
-        help_text += "💡 **Tips:**\n"
-        help_text += "• Use /tag as reply to tag on specific message\n"
-        help_text += "• Bot works in groups and private chats\n"
-        help_text += "• AFK auto-replies when someone mentions you\n"
-        # Attendance tracking removed
-        
-        await update.message.reply_text(help_text, parse_mode='Markdown')
+        await update.message.reply_text("".join(parts), parse_mode='Markdown')
     
     async def tag_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /tag command"""
@@ -97,17 +185,21 @@ class BotHandlers:
         message = update.message
         
         # Only work in groups
-        if chat.type not in [Chat.GROUP, Chat.SUPERGROUP]:
+        if chat.type not in GROUP_CHAT_TYPES:
             await message.reply_text("❌ Tag command only works in groups!")
             return
         
+        if chat.id in self._tagging:
+            await message.reply_text("⏳ Already tagging members here, please wait!")
+            return
+        
         try:
             # Check if bot is admin for automatic tagging
             is_bot_admin = await check_bot_admin_status(context.bot, chat.id)
             
             if is_bot_admin:
                 # Auto-tagging mode: get all members using enhanced method
-                members = await get_chat_members_extended(chat, context.bot, self.db)
+                members = await self._get_members(chat, context)
                 # Filter out the command sender
                 members = [member for member in members if member.id != user.id]
             else:
@@ -131,45 +223,55 @@ class BotHandlers:
             # Get default emoji
             emoji = self.db.get_default_emoji()
             
-            # Split into chunks of 10
-            member_chunks = chunk_list(members, 10)
+            # Build every tag message (TAG_BATCH_SIZE members each) before sending anything
+            fmt = format_user_mention
+            tag_texts = [" ".join(fmt(member, emoji) for member in chunk) for chunk in batched(members, TAG_BATCH_SIZE)]
+            
+            # Paced sending can take minutes in a big group; run it outside the
+            # chat's ordered section so the chat's other updates aren't held up
+            self._tagging.add(chat.id)
+            context.application.create_task(
+                self._send_tags(chat.id, message, tag_message, tag_texts),
+                update=update
+            )
             
+            # Add group to database
+            self.db.add_group(chat.id, chat.title)
+            
+        except Exception as e:
+            logger.error(f"Error in tag handler: {e}")
+            await message.reply_text("❌ An error occurred while tagging members!")
+    
+    async def _send_tags(self, chat_id: int, message, tag_message: str, tag_texts: List[str]):
+        """Send prepared tag messages in order, as fast as the group's rate limit allows"""
+        try:
             # Determine if this is a reply tag
             reply_to_message = message.reply_to_message
             
             # Send tag message first if provided
             if tag_message:
+                await SEND_LIMITER.acquire(chat_id)
                 if reply_to_message:
                     await reply_to_message.reply_text(f"📢 {tag_message}")
                 else:
                     await message.reply_text(f"📢 {tag_message}")
             
-            for i, chunk in enumerate(member_chunks):
-                tag_text = " ".join([format_user_mention(member, emoji) for member in chunk])
-                
+            for i, tag_text in enumerate(tag_texts):
                 try:
+                    await SEND_LIMITER.acquire(chat_id)
                     if reply_to_message and i == 0 and not tag_message:
                         # First chunk replies to the original message (only if no custom message)
                         await reply_to_message.reply_text(tag_text)
                     else:
                         # Subsequent chunks or regular tags
                         await message.reply_text(tag_text)
-                    
-                    # Rate limiting
-                    if i < len(member_chunks) - 1:
-                        await asyncio.sleep(0.5)
                         
                 except TelegramError as e:
                     logger.error(f"Error sending tag message: {e}")
                     await message.reply_text(f"❌ Error tagging members: {str(e)}")
                     break
-            
-            # Add group to database
-            self.db.add_group(chat.id, chat.title)
-            
-        except Exception as e:
-            logger.error(f"Error in tag handler: {e}")
-            await message.reply_text("❌ An error occurred while tagging members!")
+        finally:
+            self._tagging.discard(chat_id)
     
     async def afk_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /afk command"""
@@ -222,6 +324,8 @@ class BotHandlers:
             return
         
         if self.db.set_default_emoji(emoji):
+            # Mentions built with the old emoji won't be asked for again
+            clear_mention_cache()
             await message.reply_text(f"✅ Tag emoji set to: {emoji}")
         else:
             await message.reply_text("❌ Failed to set emoji!")
@@ -289,27 +393,28 @@ class BotHandlers:
         
         broadcast_message = " ".join(context.args)
         
-        # Get all users and groups
-        users = self.db.get_all_users()
-        groups = self.db.get_all_groups()
-        
-        success_count = 0
-        total_count = len(users) + len(groups)
+        # Stream recipients instead of building per-chat lists
+        total_count = self.db.count_users() + self.db.count_groups()
+        recipients = chain(self.db.iter_users(), self.db.iter_groups())
+        skip = {user.id}  # Don't send to the broadcaster
         
         await message.reply_text(f"📢 Broadcasting to {total_count} chats...")
         
-        # Broadcast to users
-        for user_id in users:
-            if user_id != user.id:  # Don't send to the broadcaster
-                if await safe_send_message(context.bot, user_id, f"📢 **Broadcast:**\n{broadcast_message}", parse_mode='Markdown'):
+        broadcast_text = f"📢 **Broadcast:**\n{broadcast_message}"
+        success_count = 0
+        
+        async def worker():
+            # A fixed pool of workers shares the recipient iterator, bounding
+            # requests in flight; safe_send_message keeps us within Telegram's
+            # global and per-chat rate limits
+            nonlocal success_count
+            for chat_id in recipients:
+                if chat_id in skip:
+                    continue
+                if await safe_send_message(context.bot, chat_id, broadcast_text, parse_mode='Markdown'):
                     success_count += 1
-                await asyncio.sleep(0.1)  # Rate limiting
         
-        # Broadcast to groups
-        for group_id in groups:
-            if await safe_send_message(context.bot, group_id, f"📢 **Broadcast:**\n{broadcast_message}", parse_mode='Markdown'):
-                success_count += 1
-            await asyncio.sleep(0.1)  # Rate limiting
+        await asyncio.gather(*(worker() for _ in range(BROADCAST_RATE_LIMIT)))
         
         await message.reply_text(f"✅ Broadcast sent to {success_count}/{total_count} chats!")
     
@@ -318,51 +423,53 @@ class BotHandlers:
         user = update.effective_user
         message = update.message
         chat = update.effective_chat
+        db = self.db
+        user_id = user.id
         
-        # Add user to database
-        self.db.add_user(user.id, user.username, user.first_name)
+        # Add user to database; group senders are recorded by track_member_handler
+        if chat.type not in GROUP_CHAT_TYPES:
+            db.add_user(user_id, user.username, user.first_name)
         
-        # If this is a group chat, track the user as a group member and mark attendance
-        if chat.type in [Chat.GROUP, Chat.SUPERGROUP]:
-            self.db.add_group_member(chat.id, user.id)
-            
-            # Attendance tracking removed for simplicity
+        # Attendance tracking removed for simplicity
         
         # If user is AFK and sends a message, remove AFK status and announce return
-        if self.db.is_afk(user.id):
-            afk_status = self.db.get_afk_status(user.id)
-            self.db.remove_afk(user.id)
+        if db.is_afk(user_id):
+            afk_status = db.get_afk_status(user_id)
+            db.remove_afk(user_id)
             
             if afk_status:
                 duration = format_duration(afk_status['timestamp'])
                 await message.reply_text(f"✅ Welcome back {user.first_name}!\nYou were AFK for {duration}.")
         
+        # Nobody to report on; skip the mention and reply checks
+        if not db.has_afk_users():
+            return
+        
         # Check for mentions of AFK users (replies and mentions)
-        if message.entities:
-            for entity in message.entities:
+        entities = message.entities or ()
+        if entities:
+            text = message.text
+            for entity in entities:
                 if entity.type == 'mention':
                     # Extract username from mention
-                    mentioned_username = message.text[entity.offset:entity.offset + entity.length][1:]  # Remove @
+                    mentioned_username = text[entity.offset + 1:entity.offset + entity.length]  # Skip @
                     
                     # Find user by username (this is limited - we can only check our database)
-                    for user_id_str, user_data in self.db.data['users'].items():
-                        if user_data.get('username') == mentioned_username:
-                            user_id = int(user_id_str)
-                            afk_status = self.db.get_afk_status(user_id)
-                            
-                            if afk_status:
-                                duration = format_duration(afk_status['timestamp'])
-                                afk_reason = afk_status.get('reason', '')
-                                if afk_reason:
-                                    await message.reply_text(f"💤 @{mentioned_username} is AFK for {duration}\nReason: {afk_reason}")
-                                else:
-                                    await message.reply_text(f"💤 @{mentioned_username} is AFK for {duration}")
-                            break
+                    mentioned_id = db.get_user_id_by_username(mentioned_username)
+                    afk_status = db.get_afk_status(mentioned_id) if mentioned_id is not None else None
+                    
+                    if afk_status:
+                        duration = format_duration(afk_status['timestamp'])
+                        afk_reason = afk_status.get('reason', '')
+                        if afk_reason:
+                            await message.reply_text(f"💤 @{mentioned_username} is AFK for {duration}\nReason: {afk_reason}")
+                        else:
+                            await message.reply_text(f"💤 @{mentioned_username} is AFK for {duration}")
                 
                 elif entity.type == 'text_mention':
                     # Direct user mention
                     mentioned_user = entity.user
-                    afk_status = self.db.get_afk_status(mentioned_user.id)
+                    afk_status = db.get_afk_status(mentioned_user.id)
                     
                     if afk_status:
                         duration = format_duration(afk_status['timestamp'])
@@ -374,9 +481,10 @@ class BotHandlers:
                             await message.reply_text(f"💤 {name} is AFK for {duration}")
         
         # Check if this is a reply to an AFK user
-        if message.reply_to_message and message.reply_to_message.from_user:
-            replied_user = message.reply_to_message.from_user
-            afk_status = self.db.get_afk_status(replied_user.id)
+        replied_message = message.reply_to_message
+        if replied_message and replied_message.from_user:
+            replied_user = replied_message.from_user
+            afk_status = db.get_afk_status(replied_user.id)
             
             if afk_status:
                 duration = format_duration(afk_status['timestamp'])
@@ -386,9 +494,61 @@ class BotHandlers:
                     await message.reply_text(f"💤 {name} is AFK for {duration}\nReason: {afk_reason}")
                 else:
                     await message.reply_text(f"💤 {name} is AFK for {duration}")
+    
+    async def track_member_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Record the sender of any group message as a member of that group"""
+        user = update.effective_user
+        chat = update.effective_chat
+        if user is None or user.is_bot:
+            return
         
-        # Add group to database if it's a group chat
-        if chat.type in [Chat.GROUP, Chat.SUPERGROUP]:
-            self.db.add_group(chat.id, chat.title)
+        self.db.add_user(user.id, user.username, user.first_name)
+        self.db.add_group(chat.id, chat.title)
+        self.db.add_group_member(chat.id, user.id)
+    
+    async def chat_member_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Track joins and leaves reported through chat member updates"""
+        change = update.chat_member
+        chat = change.chat
+        member = change.new_chat_member
+        if member.user.is_bot:
+            return
+        
+        self._member_cache.pop(chat.id, None)
+        if member.status in [ChatMember.LEFT, ChatMember.BANNED]:
+            self.db.remove_group_member(chat.id, member.user.id)
+        else:
+            # Joining a group doesn't make them a bot user (broadcast recipient)
+            self.db.add_profile(member.user.id, member.user.username, member.user.first_name)
+            self.db.add_group_member(chat.id, member.user.id)
+    
+    async def my_chat_member_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Track the bot's own admin status as it is promoted, demoted or removed"""
+        change = update.my_chat_member
+        chat = change.chat
+        self._member_cache.pop(chat.id, None)
+        set_bot_admin_status(
+            chat.id,
+            change.new_chat_member.status in [ChatMember.ADMINISTRATOR, ChatMember.OWNER]
+        )
+    
+    async def new_members_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Track users who join a group"""
+        chat = update.effective_chat
+        self._member_cache.pop(chat.id, None)
+        new_members = [member for member in update.message.new_chat_members if not member.is_bot]
+        if not new_members:
+            return
+        
+        # Joining a group doesn't make them a bot user (broadcast recipient)
+        for member in new_members:
+            self.db.add_profile(member.id, member.username, member.first_name)
+        self.db.add_group_members(chat.id, (member.id for member in new_members))
+    
+    async def left_member_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Forget users who leave a group"""
+        chat = update.effective_chat
+        self._member_cache.pop(chat.id, None)
+        self.db.remove_group_member(chat.id, update.message.left_chat_member.id)
     
     # Attendance commands removed for simplicity
@@ -13,8 +13,7 @@ from datetime import datetime
 # Add current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from main import main
-import asyncio
+from bot import TelegramTagBot, use_uvloop
 
 logger = logging.getLogger(__name__)
 
@@ -25,12 +24,18 @@ class BotRunner:
         self.restart_count = 0
         self.start_time = datetime.now()
         
-    async def run_with_restart(self):
+    def run_with_restart(self):
         """Run the bot with automatic restart on failure"""
+        # Build once; restarts reuse the application and its registered handlers
+        bot = TelegramTagBot(os.environ['TELEGRAM_BOT_TOKEN'])
+        application = bot.build_application()
+        
         while self.restart_count < self.max_restarts:
             try:
                 logger.info(f"Starting bot (Attempt {self.restart_count + 1}/{self.max_restarts})")
-                await main()
+                bot.run(application)
+                logger.info("Bot stopped")
+                break
                 
             except KeyboardInterrupt:
                 logger.info("Bot stopped by user")
@@ -42,7 +47,7 @@ class BotRunner:
                 
                 if self.restart_count < self.max_restarts:
                     logger.info(f"Restarting in {self.restart_delay} seconds...")
-                    await asyncio.sleep(self.restart_delay)
+                    time.sleep(self.restart_delay)
                     
                     # Reset restart count if bot has been running for more than 1 hour
                     runtime = datetime.now() - self.start_time
@@ -56,11 +61,17 @@ class BotRunner:
     
     def run(self):
         """Entry point for running the bot"""
+        # One event loop for the whole process, shared by every restart
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
         try:
-            asyncio.run(self.run_with_restart())
+            self.run_with_restart()
         except Exception as e:
             logger.error(f"Fatal error: {e}")
             sys.exit(1)
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
 
 if __name__ == "__main__":
     # Configure logging
@@ -77,6 +88,9 @@ if __name__ == "__main__":
         logger.error(f"Missing required environment variables: {missing_vars}")
         sys.exit(1)
     
+    # Must happen before BotRunner.run() creates the loop
+    use_uvloop()
+    
     # Start the bot runner
     runner = BotRunner()
-    runner.run()
\ No newline at end of file
+    runner.run()
@@ -8,7 +8,7 @@ import os
 import logging
 import sys
 import asyncio
-from bot import TelegramTagBot
+from bot import TelegramTagBot, use_uvloop
 
 # Configure logging
 logging.basicConfig(
@@ -27,6 +27,8 @@ def main():
             logger.error("TELEGRAM_BOT_TOKEN environment variable not set!")
             return
         
+        use_uvloop()
+        
         # Create and start the bot
         bot = TelegramTagBot(bot_token)
         logger.info("Starting Telegram Tag Bot...")
@@ -4,76 +4,106 @@ Utility functions for the Telegram Tag Bot
 
 import asyncio
 import logging
-from typing import List, Optional
-from datetime import datetime, timedelta
+import random
+import re
+import time
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from functools import lru_cache
+from itertools import islice
 from telegram import Chat, ChatMember, User
-from telegram.error import TelegramError
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+from config import ADMIN_CACHE_TTL, BROADCAST_RATE_LIMIT, GROUP_RATE_LIMIT
+
+try:
+    import regex
+except ImportError:  # Fall back to code point ranges with the re module
+    regex = None
 
 logger = logging.getLogger(__name__)
 
-async def get_chat_members(chat: Chat, limit: int = 200) -> List[ChatMember]:
+# Recently fetched administrator lists: chat ID -> (fetch time, admins)
+_ADMIN_CACHE: Dict[int, Tuple[float, Sequence[ChatMember]]] = {}
+_ADMIN_CACHE_SIZE = 1000
+
+async def get_chat_administrators(chat: Chat) -> Sequence[ChatMember]:
     """
-    Get list of chat members with rate limiting
+    Get chat administrators, reusing a recent fetch for the same chat
+    """
+    cached = _ADMIN_CACHE.get(chat.id)
+    if cached and time.monotonic() - cached[0] < ADMIN_CACHE_TTL:
+        return cached[1]
+    
+    await SEND_LIMITER.global_limiter.acquire()
+    admins = await chat.get_administrators()
+    _ADMIN_CACHE.pop(chat.id, None)
+    if len(_ADMIN_CACHE) >= _ADMIN_CACHE_SIZE:
+        # Drop the oldest entry
+        _ADMIN_CACHE.pop(next(iter(_ADMIN_CACHE)))
+    _ADMIN_CACHE[chat.id] = (time.monotonic(), admins)
+    return admins
+
+async def get_chat_members(chat: Chat) -> List[ChatMember]:
+    """
+    Get the chat members the Bot API will list (the administrators)
     """
-    members = []
     try:
-        # Get administrators first
-        admins = await chat.get_administrators()
-        members.extend(admins)
-        
-        # For small groups, try to get all members
-        if chat.type in [Chat.GROUP, Chat.SUPERGROUP]:
-            try:
-                # This might not work for large groups due to API limitations
-                member_count = await chat.get_member_count()
-                if member_count <= limit:
-                    # We can only get members we can see (recent activity)
-                    # Telegram API doesn't allow getting all members for privacy reasons
-                    pass
-            except TelegramError as e:
-                logger.warning(f"Could not get member count: {e}")
-        
-        return members
+        return list(await get_chat_administrators(chat))
     except TelegramError as e:
-        logger.error(f"Error getting chat members: {e}")
+        logger.error("Error getting chat members: %s", e)
         return []
 
-def format_user_mention(user: User, emoji: str = "🔔") -> str:
+@lru_cache(maxsize=10_000)
+def _mention_cached(user_id: int, first_name: str, username: Optional[str], emoji: str) -> str:
     """
-    Format user mention with emoji (simple text format)
+    Build a mention string; cached since rosters change slowly between /tag calls
     """
-    if user.username:
-        return f"{emoji} @{user.username}"
+    if username:
+        return f"{emoji} @{username}"
     else:
         # Use first name with emoji for users without username
-        return f"{emoji} {user.first_name}"
+        return f"{emoji} {first_name}"
 
-def chunk_list(lst: List, chunk_size: int) -> List[List]:
+def format_user_mention(user: Union[User, 'LightUser'], emoji: str = "🔔") -> str:
     """
-    Split list into chunks of specified size
+    Format user mention with emoji (simple text format)
+    """
+    return _mention_cached(user.id, user.first_name, user.username, emoji)
+
+def clear_mention_cache():
     """
-    return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
+    Drop cached mentions, e.g. after the tag emoji changes
+    """
+    _mention_cached.cache_clear()
+
+try:
+    from itertools import batched
+except ImportError:  # Python < 3.12
+    def batched(iterable: Iterable, n: int) -> Iterator[tuple]:
+        """
+        Lazily yield tuples of up to n items from iterable
+        """
+        iterator = iter(iterable)
+        while batch := tuple(islice(iterator, n)):
+            yield batch
+
+if regex is not None:
+    # Up to three emoji grapheme clusters, so ZWJ families, flags and
+    # skin tones count as one emoji each
+    _EMOJI_RE = regex.compile(r'(?:(?=\p{Extended_Pictographic}|\p{Regional_Indicator})\X){1,3}')
+else:
+    # One emoji code point, optionally followed by up to three more emoji,
+    # skin-tone modifiers, variation selectors or zero-width joiners
+    _EMOJI_RE = re.compile(
+        '[\u2600-\u27BF\U0001F000-\U0001FFFF]'
+        '[\u200D\uFE0F\u2600-\u27BF\U0001F000-\U0001FFFF]{0,3}'
+    )
 
 def is_valid_emoji(text: str) -> bool:
     """
     Basic emoji validation
     """
-    if not text:
-        return False
-    
-    # Check if it's a single character and appears to be an emoji
-    if len(text) == 1:
-        # Basic emoji ranges (this is simplified)
-        code_point = ord(text)
-        return (0x1F600 <= code_point <= 0x1F64F or  # Emoticons
-                0x1F300 <= code_point <= 0x1F5FF or  # Miscellaneous Symbols
-                0x1F680 <= code_point <= 0x1F6FF or  # Transport and Map
-                0x1F1E6 <= code_point <= 0x1F1FF or  # Regional indicators
-                0x2600 <= code_point <= 0x26FF or    # Miscellaneous symbols
-                0x2700 <= code_point <= 0x27BF)      # Dingbats
-    
-    # Allow multi-character emojis (simplified check)
-    return len(text) <= 4 and any(ord(c) > 0x1F000 for c in text)
+    return bool(text) and _EMOJI_RE.fullmatch(text) is not None
 
 def parse_username(text: str) -> Optional[str]:
     """
@@ -81,65 +111,205 @@ def parse_username(text: str) -> Optional[str]:
     """
     if not text:
         return None
-    
-    text = text.strip()
-    if text.startswith('@'):
-        return text[1:]
-    return text
+    return text.strip().lstrip('@') or None
 
-async def safe_send_message(bot, chat_id: int, text: str, **kwargs) -> bool:
+async def safe_send_message(bot, chat_id: int, text: str, retries: int = 3, timeout: float = 10,
+                            max_retry_after: float = 30, **kwargs) -> bool:
     """
     Safely send message with error handling
+    Paced by SEND_LIMITER; waits out short flood limits and retries network
+    errors and timeouts with backoff
     """
-    try:
-        await bot.send_message(chat_id=chat_id, text=text, **kwargs)
-        return True
-    except TelegramError as e:
-        logger.error(f"Error sending message to {chat_id}: {e}")
+    for attempt in range(retries):
+        await SEND_LIMITER.acquire(chat_id)
+        try:
+            await asyncio.wait_for(bot.send_message(chat_id=chat_id, text=text, **kwargs), timeout)
+            return True
+        except RetryAfter as e:
+            if e.retry_after > max_retry_after:
+                # Waiting this long would stall the caller (e.g. a broadcast worker)
+                logger.error("Flood limit of %ss sending to %s, giving up", e.retry_after, chat_id)
+                return False
+            logger.warning("Flood limit sending to %s, retrying in %ss", chat_id, e.retry_after)
+            delay = e.retry_after + random.random() * 0.2
+        except (BadRequest, Forbidden) as e:
+            # Permanent (bad chat, blocked bot, unparsable text); retrying won't help.
+            # BadRequest subclasses NetworkError, so it must be caught first
+            logger.error("Error sending message to %s: %s", chat_id, e)
+            return False
+        except (NetworkError, asyncio.TimeoutError) as e:
+            logger.warning("Network error or timeout sending to %s: %r", chat_id, e)
+            delay = 2 ** attempt
+        except TelegramError as e:
+            logger.error("Error sending message to %s: %s", chat_id, e)
+            return False
+        
+        # No point waiting after the last attempt
+        if attempt < retries - 1:
+            await asyncio.sleep(delay)
+    
+    logger.error("Giving up sending message to %s after %s attempts", chat_id, retries)
+    return False
+
+class AsyncLimiter:
+    """
+    Token bucket allowing max_rate operations per time_period seconds
+    """
+    
+    def __init__(self, max_rate: float, time_period: float = 1.0):
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._tokens = max_rate
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._tokens = min(self.max_rate, self._tokens + elapsed * self.max_rate / self.time_period)
+        self._last_refill = now
+    
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) * self.time_period / self.max_rate)
+                self._refill()
+            self._tokens -= 1
+    
+    def is_idle(self) -> bool:
+        """Check if the bucket is full and nobody is waiting on it"""
+        self._refill()
+        return self._tokens >= self.max_rate and not self._lock.locked()
+    
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
         return False
 
-async def rate_limited_operation(operations: List, delay: float = 0.1):
+class RateLimiter:
     """
-    Execute operations with rate limiting
+    Rate limiting for outgoing messages: a global limit plus a per-chat one
+    Groups (negative chat IDs) get a per-minute window instead of a per-second rate
+    Other API calls (lookups) should wait on global_limiter only
     """
-    for operation in operations:
-        try:
-            await operation
-            await asyncio.sleep(delay)
-        except Exception as e:
-            logger.error(f"Error in rate limited operation: {e}")
+    
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_period: float = 1.0,
+                 group_rate: int = 20, group_period: float = 60.0):
+        self.global_limiter = AsyncLimiter(global_rate, 1)
+        self.chat_rate = chat_rate
+        self.chat_period = chat_period
+        self._chat_limiters: Dict[int, AsyncLimiter] = {}
+        self._prune_at = 1024
+        self._group_limiter = GroupRateLimiter(group_rate, group_period)
+    
+    def _prune(self):
+        """Forget per-chat buckets that have fully refilled"""
+        for chat_id in [chat_id for chat_id, limiter in self._chat_limiters.items() if limiter.is_idle()]:
+            del self._chat_limiters[chat_id]
+        self._prune_at = max(1024, 2 * len(self._chat_limiters))
+    
+    async def acquire(self, chat_id: int):
+        """Wait until a message may be sent to chat_id"""
+        # Wait for the chat first so a slow chat doesn't hold a global token
+        if chat_id < 0:
+            await self._group_limiter.acquire(chat_id)
+        else:
+            limiter = self._chat_limiters.get(chat_id)
+            if limiter is None:
+                if len(self._chat_limiters) >= self._prune_at:
+                    self._prune()
+                limiter = self._chat_limiters[chat_id] = AsyncLimiter(self.chat_rate, self.chat_period)
+            await limiter.acquire()
+        await self.global_limiter.acquire()
 
-def format_duration(start_time: str) -> str:
+class GroupRateLimiter:
     """
-    Format duration from AFK start time to current time
+    Sliding-window limit of max_messages per window seconds for each chat
+    """
+    
+    def __init__(self, max_messages: int = 20, window: float = 60.0):
+        self.max_messages = max_messages
+        self.window = window
+        self._windows: Dict[int, deque] = {}
+        self._prune_at = 1024
+    
+    def _prune(self):
+        """Forget chats with nothing sent inside the current window"""
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, sent_times in self._windows.items()
+                        if not sent_times or now - sent_times[-1] >= self.window]:
+            del self._windows[chat_id]
+        self._prune_at = max(1024, 2 * len(self._windows))
+    
+    async def acquire(self, chat_id: int):
+        """Wait until another message may be sent to chat_id"""
+        sent_times = self._windows.get(chat_id)
+        if sent_times is None:
+            if len(self._windows) >= self._prune_at:
+                self._prune()
+            sent_times = self._windows[chat_id] = deque()
+        while True:
+            now = time.monotonic()
+            while sent_times and now - sent_times[0] >= self.window:
+                sent_times.popleft()
+            if len(sent_times) < self.max_messages:
+                sent_times.append(now)
+                return
+            await asyncio.sleep(self.window - (now - sent_times[0]))
+
+# Shared by everything the bot sends, so Telegram's limits hold bot-wide
+SEND_LIMITER = RateLimiter(BROADCAST_RATE_LIMIT, group_rate=GROUP_RATE_LIMIT)
+
+@lru_cache(maxsize=1024)
+def _format_minutes(total_minutes: int) -> str:
+    """
+    Format a whole number of minutes; cached since the text only changes once a minute
+    """
+    hours, minutes = divmod(total_minutes, 60)
+    
+    if hours > 0:
+        return f"{hours} hour{'s' if hours != 1 else ''} {minutes} minute{'s' if minutes != 1 else ''}"
+    else:
+        return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+def format_duration(start_time: int) -> str:
+    """
+    Format duration from AFK start time (epoch seconds) to current time
     """
     try:
-        start_dt = datetime.fromisoformat(start_time)
-        now = datetime.now()
-        duration = now - start_dt
-        
-        # Calculate hours and minutes
-        total_minutes = int(duration.total_seconds() / 60)
-        hours = total_minutes // 60
-        minutes = total_minutes % 60
-        
-        if hours > 0:
-            return f"{hours} hour{'s' if hours != 1 else ''} {minutes} minute{'s' if minutes != 1 else ''}"
-        else:
-            return f"{minutes} minute{'s' if minutes != 1 else ''}"
+        return _format_minutes(max(0, int(time.time()) - int(start_time)) // 60)
     except Exception as e:
-        logger.error(f"Error formatting duration: {e}")
+        logger.error("Error formatting duration: %s", e)
         return "some time"
 
+# Chat ID -> whether the bot is an admin there, kept current by my_chat_member updates
+_BOT_IS_ADMIN: Dict[int, bool] = {}
+
+def set_bot_admin_status(chat_id: int, is_admin: bool):
+    """
+    Record the bot's admin status in a chat (from a my_chat_member update)
+    """
+    _BOT_IS_ADMIN[chat_id] = is_admin
+
 async def check_bot_admin_status(bot, chat_id: int) -> bool:
     """
     Check if bot is admin in the chat
     """
+    is_admin = _BOT_IS_ADMIN.get(chat_id)
+    if is_admin is not None:
+        return is_admin
+    
     try:
+        await SEND_LIMITER.global_limiter.acquire()
         bot_member = await bot.get_chat_member(chat_id, bot.id)
-        return bot_member.status in [ChatMember.ADMINISTRATOR, ChatMember.OWNER]
+        is_admin = _BOT_IS_ADMIN[chat_id] = bot_member.status in [ChatMember.ADMINISTRATOR, ChatMember.OWNER]
+        return is_admin
     except TelegramError as e:
-        logger.error(f"Error checking bot admin status: {e}")
+        logger.error("Error checking bot admin status: %s", e)
         return False
 
 async def get_all_chat_members(chat: Chat, bot) -> List[User]:
@@ -156,32 +326,140 @@ async def get_all_chat_members(chat: Chat, bot) -> List[User]:
         
         # Get administrators first - these are always visible
         try:
-            admins = await chat.get_administrators()
+            admins = await get_chat_administrators(chat)
             for admin in admins:
                 if not admin.user.is_bot and admin.user.id not in seen_user_ids:
                     members.append(admin.user)
                     seen_user_ids.add(admin.user.id)
         except TelegramError as e:
-            logger.warning(f"Could not get administrators: {e}")
+            logger.warning("Could not get administrators: %s", e)
         
-        # Log member count for reference
-        try:
-            member_count = await chat.get_member_count()
-            logger.info(f"Total member count: {member_count}, found {len(members)} admins")
-        except TelegramError as e:
-            logger.warning(f"Could not get member count: {e}")
+        # Log member count for reference; costs a round trip, so debug only
+        if logger.isEnabledFor(logging.DEBUG):
+            try:
+                await SEND_LIMITER.global_limiter.acquire()
+                member_count = await chat.get_member_count()
+                logger.debug("Total member count: %s, found %s admins", member_count, len(members))
+            except TelegramError as e:
+                logger.warning("Could not get member count: %s", e)
             
         return members
         
     except TelegramError as e:
-        logger.error(f"Error getting chat members: {e}")
+        logger.error("Error getting chat members: %s", e)
         return []
 
-async def get_chat_members_extended(chat: Chat, bot, database) -> List[User]:
+class LightUser:
     """
-    Enhanced member fetching using bot's database and aggressive member discovery
+    Stored user with just the fields tagging needs; cheaper than telegram.User
+    """
+    
+    __slots__ = ('id', 'first_name', 'username', 'is_bot')
+    
+    def __init__(self, id: int, first_name: str, username: Optional[str] = None, is_bot: bool = False):
+        self.id = id
+        self.first_name = first_name
+        self.username = username
+        self.is_bot = is_bot
+
+# (chat ID, user ID) -> when a stored member was last checked with Telegram
+_VERIFIED_AT: Dict[Tuple[int, int], float] = {}
+VERIFY_INTERVAL = 3600
+
+# Background re-checks get their own slow bucket so they never queue ahead
+# of user-visible sends, and each roster fetch re-checks at most a batch
+VERIFY_LIMITER = AsyncLimiter(5, 1)
+VERIFY_BATCH = 200
+
+def _claim_stale_members(chat_id: int, user_ids: Iterable[int]) -> List[int]:
+    """
+    Pick up to VERIFY_BATCH members not checked within VERIFY_INTERVAL, marking
+    them checked now so overlapping calls don't pick them again
+    """
+    now = time.monotonic()
+    stale_ids = []
+    for user_id in user_ids:
+        key = (chat_id, user_id)
+        verified_at = _VERIFIED_AT.get(key)
+        if verified_at is None or now - verified_at >= VERIFY_INTERVAL:
+            _VERIFIED_AT[key] = now
+            stale_ids.append(user_id)
+            if len(stale_ids) >= VERIFY_BATCH:
+                break
+    return stale_ids
+
+async def verify_group_members(chat_id: int, bot, database, user_ids: Iterable[int], concurrency: int = 3):
+    """
+    Re-check stored group members with Telegram and forget those who left
+    """
+    pending = iter(user_ids)
+    gone = []
+    
+    async def worker():
+        # A fixed pool of workers bounds requests in flight (and memory)
+        for user_id in pending:
+            try:
+                await VERIFY_LIMITER.acquire()
+                member_info = await bot.get_chat_member(chat_id, user_id)
+                if member_info.status in [ChatMember.LEFT, ChatMember.BANNED]:
+                    gone.append(user_id)
+            except TelegramError as e:
+                # PTB strips the "Bad Request: " prefix from the message
+                if "user not found" in str(e).lower():
+                    gone.append(user_id)
+                else:
+                    logger.debug("Could not check user %s: %s", user_id, e)
+            except Exception as e:
+                logger.warning("Unexpected error checking user %s: %s", user_id, e)
+    
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    
+    for user_id in gone:
+        _VERIFIED_AT.pop((chat_id, user_id), None)
+        database.remove_group_member(chat_id, user_id)
+    if gone:
+        logger.info("Removed %s departed members from group %s", len(gone), chat_id)
+
+def _schedule_verification(application, chat_id: int, database, user_ids: Iterable[int]):
+    """
+    Re-check a batch of stale members in the background, off the hot path
+    """
+    stale_ids = _claim_stale_members(chat_id, user_ids)
+    if stale_ids:
+        # application.create_task so stop() awaits it and errors reach the error handlers
+        application.create_task(
+            verify_group_members(chat_id, application.bot, database, stale_ids),
+            name=f"verify_group_members:{chat_id}"
+        )
+
+async def get_chat_members_extended(chat: Chat, bot, database, application) -> List[Union[User, LightUser]]:
+    """
+    Enhanced member fetching using admins plus the group members the bot has seen
     """
     try:
+        # Loop-invariant lookups hoisted out of the per-member loops
+        chat_id = chat.id
+        get_member_info = database.get_member_info
+        
+        # Refreshed recently: admins (from the admin cache) plus the stored
+        # index make up the roster; membership re-checks continue in batches
+        if database.group_members_fresh(chat_id, VERIFY_INTERVAL):
+            stored_member_ids = database.get_group_members(chat_id)
+            _schedule_verification(application, chat_id, database, stored_member_ids)
+            try:
+                members = [admin.user for admin in await get_chat_administrators(chat) if not admin.user.is_bot]
+            except TelegramError as e:
+                logger.warning("Could not get administrators: %s", e)
+                members = []
+            seen_user_ids = {member.id for member in members}
+            for user_id in stored_member_ids:
+                if user_id in seen_user_ids:
+                    continue
+                user_data = get_member_info(user_id)
+                if user_data is not None:
+                    members.append(LightUser(user_id, user_data.get('first_name', 'User'), user_data.get('username')))
+            return members
+        
         members = []
         seen_user_ids = set()
         
@@ -192,67 +470,28 @@ async def get_chat_members_extended(chat: Chat, bot, database) -> List[User]:
                 members.append(member)
                 seen_user_ids.add(member.id)
         
-        # Get stored group members from database
-        stored_member_ids = database.get_group_members(chat.id)
+        # Get stored group members from database; these are recorded from
+        # every update seen in the group, so no probing is needed
+        stored_member_ids = database.get_group_members(chat_id)
         
-        # Add stored group members with verification
         for user_id in stored_member_ids:
-            if user_id not in seen_user_ids and str(user_id) in database.data.get('users', {}):
-                user_data = database.data['users'][str(user_id)]
-                # Create User object from stored data (trust our database)
-                from telegram import User
-                user = User(
-                    id=user_id,
-                    is_bot=False,
-                    first_name=user_data.get('first_name', 'User'),
-                    username=user_data.get('username')
-                )
+            if user_id in seen_user_ids:
+                continue
+            user_data = get_member_info(user_id)
+            if user_data is not None:
+                # Build a lightweight user from stored data (trust our database)
+                user = LightUser(user_id, user_data.get('first_name', 'User'), user_data.get('username'))
                 members.append(user)
                 seen_user_ids.add(user_id)
         
-        # Aggressively check ALL known users to discover new group members
-        logger.info(f"Checking {len(database.data.get('users', {}))} known users for group membership")
-        check_count = 0
-        for user_id_str, user_data in database.data.get('users', {}).items():
-            user_id = int(user_id_str)
-            if user_id not in seen_user_ids:
-                try:
-                    # Check if user is in the group
-                    member_info = await bot.get_chat_member(chat.id, user_id)
-                    check_count += 1
-                    
-                    if member_info.status not in [ChatMember.LEFT, ChatMember.BANNED]:
-                        # Add to group members list for future reference
-                        database.add_group_member(chat.id, user_id)
-                        # Create User object
-                        from telegram import User
-                        user = User(
-                            id=user_id,
-                            is_bot=False,
-                            first_name=user_data.get('first_name', 'User'),
-                            username=user_data.get('username')
-                        )
-                        members.append(user)
-                        seen_user_ids.add(user_id)
-                        logger.info(f"Discovered new group member: {user_data.get('first_name', 'User')}")
-                    
-                    # Rate limiting - small delay between checks
-                    if check_count % 5 == 0:
-                        await asyncio.sleep(0.1)
-                        
-                except TelegramError as e:
-                    # User not in group or inaccessible
-                    if "Bad Request: user not found" not in str(e):
-                        logger.debug(f"Could not check user {user_id}: {e}")
-                    continue
-                except Exception as e:
-                    logger.warning(f"Unexpected error checking user {user_id}: {e}")
-                    continue
+        # Weed out members who left without us seeing it
+        _schedule_verification(application, chat_id, database, stored_member_ids)
+        database.mark_group_members_refreshed(chat_id)
         
-        logger.info(f"Checked {check_count} users, found {len(members)} total members for tagging in group {chat.id}")
+        logger.info("Found %s total members for tagging in group %s", len(members), chat_id)
         return members
         
     except Exception as e:
-        logger.error(f"Error getting extended chat members: {e}")
+        logger.error("Error getting extended chat members: %s", e)
         # Fall back to basic method
         return await get_all_chat_members(chat, bot)
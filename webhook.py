@@ -0,0 +1,40 @@
+"""
+Web server request handlers for webhook mode
+Serves Telegram updates and Render's health check on the same port
+"""
+
+import json
+import logging
+from tornado.web import Application as WebApplication, RequestHandler
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+class HealthHandler(RequestHandler):
+    """Health check for Render"""
+    
+    def get(self):
+        self.write("OK")
+
+class WebhookHandler(RequestHandler):
+    """Receives updates pushed by Telegram and queues them for the bot"""
+    
+    def initialize(self, bot_application: Application):
+        self.bot_application = bot_application
+    
+    async def post(self):
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot_application.bot)
+        except ValueError as e:
+            logger.error(f"Invalid webhook payload: {e}")
+            self.set_status(400)
+            return
+        await self.bot_application.update_queue.put(update)
+
+def create_web_app(application: Application, url_path: str) -> WebApplication:
+    """Build the web app serving the webhook path and /health"""
+    return WebApplication([
+        (r'/health', HealthHandler),
+        (rf'/{url_path}', WebhookHandler, {'bot_application': application}),
+    ])